@@ -8,10 +8,13 @@
 # -----------------------------------------------------------------------------
 # print・inputを含むインタラクティブ処理や、エラー時の終了処理は、本番環境の仕様に合わせて修正が必要です
 
+import collections
 import csv
 import sqlite3
 import sys
 import os
+import itertools
+import operator
 import logging
 
 # 環境変数の設定
@@ -21,6 +24,46 @@ LOG_FORMAT = os.environ.get('LOG_FORMAT', '%(asctime)s [%(levelname)s] %(message
 DATE_FORMAT= os.environ.get('DATE_FORMAT', '%Y-%m-%d %H:%M:%S')
 DB_PATH = os.environ.get('DB_PATH', 'company.db')
 
+# SQLiteの1文あたりのパラメータ数上限
+MAX_SQL_PARAMS = 999
+
+# executemany に1回で渡す行数
+EXECUTEMANY_BATCH_SIZE = 500
+
+# 検証済みの行（タプルのため行ごとの __dict__ を持たず、属性名で参照する）
+EmployeeRow = collections.namedtuple('EmployeeRow', ['employee_id', 'employee_name', 'basic_salary'])
+
+# CSVに必須の列名（標準の列順。EmployeeRow のフィールドと同じ順に並べる）
+REQUIRED_COLUMNS = ('社員番号', '社員名', '基本給')
+
+# CSVの列名に対応する EmployeeRow のフィールド名
+EMPLOYEE_ROW_FIELD_BY_COLUMN = dict(zip(REQUIRED_COLUMNS, EmployeeRow._fields))
+
+# 1行ずつ更新するSQL（SQL文字列が固定のため、sqlite3のステートメントキャッシュが再利用される）
+UPDATE_EMP_NAME_SQL = "UPDATE employees SET employee_name=? WHERE employee_id=?"
+UPDATE_SALARY_SQL = "UPDATE salaries SET basic_salary=? WHERE employee_id=?"
+UPDATE_SQL_BY_COLUMN = {'社員名': UPDATE_EMP_NAME_SQL, '基本給': UPDATE_SALARY_SQL}
+
+# 複数行を1文でまとめて更新するSQLのテンプレート
+# {values} には (社員番号, 値) のプレースホルダがバッチの行数だけ並ぶため、SQL文字列はバッチの行数ごとに異なる
+BATCH_UPDATE_EMP_NAME_SQL = ("UPDATE employees SET employee_name=v.column2 FROM (VALUES {values}) AS v "
+                             "WHERE employees.employee_id=v.column1")
+BATCH_UPDATE_SALARY_SQL = ("UPDATE salaries SET basic_salary=v.column2 FROM (VALUES {values}) AS v "
+                           "WHERE salaries.employee_id=v.column1")
+BATCH_UPDATE_SQL_BY_COLUMN = {'社員名': BATCH_UPDATE_EMP_NAME_SQL, '基本給': BATCH_UPDATE_SALARY_SQL}
+
+# UPDATE ... FROM は SQLite 3.33.0 以降でのみ使用できる（それ以前は1行ずつ更新する）
+SUPPORTS_UPDATE_FROM = sqlite3.sqlite_version_info >= (3, 33, 0)
+
+# 接続時に設定するPRAGMA
+CONNECTION_PRAGMAS = """
+    PRAGMA foreign_keys = ON;     -- 外部キー制約を有効にする
+    PRAGMA journal_mode = WAL;    -- ジャーナルをWALにしてfsyncを減らす
+    PRAGMA synchronous = NORMAL;  -- WAL使用時はNORMALでも整合性は保たれる
+    PRAGMA temp_store = MEMORY;   -- 一時データをメモリ上に置く
+    PRAGMA cache_size = -64000;   -- ページキャッシュを約64MBにする
+"""
+
 # ロギングの設定
 logging.basicConfig(filename=LOG_FILE_PATH,
                     level=LOG_LEVEL,
@@ -31,9 +74,9 @@ logging.basicConfig(filename=LOG_FILE_PATH,
 class DatabaseConnection:
     def __init__(self):
         try:
-            self.conn = sqlite3.connect(DB_PATH)
+            self.conn = sqlite3.connect(DB_PATH, isolation_level=None, cached_statements=256)  # トランザクションは明示的に管理する
             self.cur = self.conn.cursor()
-            self.conn.execute("PRAGMA foreign_keys = ON")  # 外部キー制約を有効にする
+            self.conn.executescript(CONNECTION_PRAGMAS)  # PRAGMAを1回の呼び出しでまとめて設定する
         except sqlite3.Error as e:
             logging.error(f'データベースに接続できませんでした: {e}')
             sys.exit(1)
@@ -42,13 +85,26 @@ class DatabaseConnection:
         return self.conn, self.cur
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if exc_type is not None:
-            self.conn.rollback()
-            logging.error(f'トランザクション中にエラーが発生しました: {exc_val}')
-            print("エラーが発生しました。詳細はログを確認してください。")
-        else:
-            self.conn.commit()
-        self.conn.close()
+        try:
+            if exc_type is not None:
+                self.conn.rollback()
+                logging.error(f'トランザクション中にエラーが発生しました: {exc_val}')
+                print("エラーが発生しました。詳細はログを確認してください。")
+            else:
+                try:
+                    self.conn.commit()  # 遅延させた外部キー制約の違反はここで検出される
+                except sqlite3.Error as e:
+                    self.conn.rollback()
+                    logging.error(f'コミット中にエラーが発生しました: {e}')
+                    print("エラーが発生しました。詳細はログを確認してください。")
+                    raise e  # エラーを再度スローする
+        finally:
+            self.conn.close()
+
+# 書き込みトランザクションを開始する（ユーザーへの確認が済んでから呼び出す）
+def begin_transaction(conn):
+    conn.execute("BEGIN IMMEDIATE")  # 全ての登録・更新を1つのトランザクションにまとめる
+    conn.execute("PRAGMA defer_foreign_keys = ON")  # 外部キーの検査をコミット時にまとめて行う
 
 # （要件外）テーブルの作成
 def create_tables(cur):
@@ -61,109 +117,160 @@ def create_tables(cur):
                         employee_id INTEGER,
                         basic_salary INTEGER NOT NULL,
                         FOREIGN KEY(employee_id) REFERENCES employees(employee_id) ON DELETE CASCADE)''')
+
+        # 社員番号での更新・存在確認を全件走査ではなくインデックス検索にする
+        # （既存データに重複があっても失敗しないよう、一意制約は付けない）
+        cur.execute('''CREATE INDEX IF NOT EXISTS idx_salaries_emp ON salaries(employee_id)''')
     except sqlite3.Error as e:
         logging.error(f'テーブルの作成中にエラーが発生しました: {e}')
         raise e
 
+# iterable を size 件ずつのタプルに分割する（Python 3.12 の itertools.batched 相当）
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := tuple(itertools.islice(iterator, size)):
+        yield batch
+
+# 1文に含められる最大行数を、1行あたりのパラメータ数から求める
+def max_batch_rows(num_columns):
+    return MAX_SQL_PARAMS // num_columns
+
 # ファイルとデータのバリデーション
+# 検証に成功した場合は EmployeeRow のタプルを返し、失敗した場合は None を返す
 def validate_file_and_data(filename):
-    if not os.path.exists(filename):
-        message = "ファイルが見つかりません"
-        logging.error(message)
-        return False
-
     if not filename.endswith('.csv'):
         message = "CSVファイルを指定してください"
         logging.error(message)
-        return False
-
-    with open(filename, 'r', newline='') as file:
-        reader = csv.DictReader(file)
-        valid_columns = {'社員番号', '社員名', '基本給'}
-        fieldnames = set(reader.fieldnames)
-        if not fieldnames.issubset(valid_columns):  # 列名が不正でないことを確認
-            message = "列名が不正です"
-            logging.error(message)
-            return False
-        if len(fieldnames) != len(reader.fieldnames):  # 列名が重複していないことを確認
-            message = "列名が重複しています"
-            logging.error(message)
-            return False
-        for row in reader:  # データに欠損値や不正な値がないことを確認
-            employee_id = row.get('社員番号')
-            basic_salary = row.get('基本給')
-            try:
-                if not employee_id or not basic_salary:
-                    message = f"欠損値があります: 社員番号 {employee_id}, 基本給 {basic_salary}"
-                    logging.error(message)
-                    return False
-                if int(employee_id) <= 0 or int(basic_salary) <= 0:
-                    message = f"正の整数を指定してください: 社員番号 {employee_id}, 基本給 {basic_salary}"
-                    logging.error(message)
-                    return False
-            except ValueError:
-                message = f"数値に変換できません: 社員番号 {employee_id}, 基本給 {basic_salary}"
+        return None
+
+    try:  # 存在確認は行わず、開けなかった場合の例外で判定する
+        file = open(filename, 'r', newline='', encoding='utf-8')
+    except FileNotFoundError:
+        message = "ファイルが見つかりません"
+        logging.error(message)
+        return None
+
+    with file:
+        reader = csv.reader(file)
+        header = tuple(next(reader, ()))
+        if header != REQUIRED_COLUMNS:  # 標準の列順であれば1回のタプル比較で済ませる
+            fieldnames = set(header)
+            if fieldnames != set(REQUIRED_COLUMNS):  # 列名が不正でなく、不足していないことを確認
+                message = "列名が不正です"
+                logging.error(message)
+                return None
+            if len(fieldnames) != len(header):  # 列名が重複していないことを確認
+                message = "列名が重複しています"
                 logging.error(message)
-                return False
+                return None
+        # 列番号を事前に求めておき、行ごとに辞書を作らない
+        width = len(header)
+        columns = {name: index for index, name in enumerate(header)}
+        get_fields = operator.itemgetter(*(columns[name] for name in REQUIRED_COLUMNS))
+        fields = []
+        for values in reader:
+            if not values:  # 空行は読み飛ばす
+                continue
+            if len(values) != width:  # 列数が合わない行だけ切り詰め・補完する
+                del values[width:]
+                values.extend([''] * (width - len(values)))
+            fields.append(get_fields(values))
 
-    return True
+    return validate_rows(fields)
 
-# （要件外）未登録社員を各テーブルに登録する
-def create_new_employee(cur, employee_id, employee_name):
+# 各行の (社員番号, 社員名, 基本給) の文字列を検証し、数値に変換した EmployeeRow のタプルを返す
+def validate_rows(fields):
+    # 全行が正常であれば、変換と範囲チェックをC実装の組み込み関数（map・min）にまとめて任せる
+    id_column, name_column, salary_column = zip(*fields) if fields else ((), (), ())
     try:
-        cur.execute("INSERT INTO employees (employee_id, employee_name) VALUES (?, ?)", (employee_id, employee_name))
-        cur.execute("INSERT INTO salaries (employee_id, basic_salary) VALUES (?, 0)", (employee_id,))
-        print(f"未登録社員を登録しました: 社員番号 {employee_id}, 社員名 {employee_name}")
+        employee_ids = list(map(int, id_column))
+        basic_salaries = list(map(int, salary_column))
+    except ValueError:
+        employee_ids = basic_salaries = None
+    if employee_ids is not None and (not fields or min(employee_ids) > 0 and min(basic_salaries) > 0):
+        return tuple(map(EmployeeRow, employee_ids, name_column, basic_salaries))
+
+    # 不正な行がある場合は1行ずつ確認し、最初の不正な行だけを報告する
+    # （ログ出力はループ内で最大1回。メッセージの整形はロギング側に遅延させる）
+    rows = []
+    for employee_id, employee_name, basic_salary in fields:  # データに欠損値や不正な値がないことを確認
+        if not employee_id or not basic_salary:
+            logging.error("欠損値があります: 社員番号 %s, 基本給 %s", employee_id, basic_salary)
+            return None
+        try:  # 数値への変換は1行につき1回だけ行い、変換結果をそのまま保持する
+            parsed_id, parsed_salary = int(employee_id), int(basic_salary)
+        except ValueError:
+            logging.error("数値に変換できません: 社員番号 %s, 基本給 %s", employee_id, basic_salary)
+            return None
+        if parsed_id <= 0 or parsed_salary <= 0:
+            logging.error("正の整数を指定してください: 社員番号 %s, 基本給 %s", employee_id, basic_salary)
+            return None
+        rows.append(EmployeeRow(parsed_id, employee_name, parsed_salary))
+    return tuple(rows)
+
+# （要件外）未登録社員を各テーブルにまとめて登録する
+def create_new_employees(cur, employees):
+    try:
+        for batch in batched(employees, EXECUTEMANY_BATCH_SIZE):
+            cur.executemany("INSERT OR IGNORE INTO employees (employee_id, employee_name) VALUES (?, ?)", batch)
+            # 今回登録した社員のうち、給与マスタに未登録の社員だけを登録する
+            cur.executemany("""INSERT INTO salaries (employee_id, basic_salary)
+                               SELECT ?1, 0 WHERE NOT EXISTS (SELECT 1 FROM salaries WHERE employee_id = ?1)""",
+                            ((employee_id,) for employee_id, _ in batch))
+        print(f"未登録社員を {len(employees)} 件登録しました")
     except sqlite3.Error as e:
         logging.error(f'未登録社員の登録中にエラーが発生しました: {e}')
         raise e  # エラーを再度スローする
 
-# 未登録社員の登録を確認し実行する
-def create_new_employees_from_csv(cur, filename):
-    with open(filename, 'r', newline='') as file:
-        reader = csv.DictReader(file)
-        new_employees = []
-        for row in reader:
-            employee_id = row.get('社員番号')
-            employee_name = row.get('社員名', '')
-            if employee_id:
-                cur.execute("SELECT * FROM employees WHERE employee_id=?", (employee_id,))
-                employee = cur.fetchone()
-                if not employee:
-                    new_employees.append((employee_id, employee_name))
-        if new_employees:
-            print(f"未登録社員が {len(new_employees)} 件見つかりました")
-            for employee in new_employees:
-                print(f"社員番号 {employee[0]}, 社員名 {employee[1]}")
-            while True:  # ユーザーからの入力をバリデーションする
-                answer = input("これらの未登録社員を登録しますか？ (y/n): ").lower()
-                if answer in ['y', 'n']:
-                    break
-                print("無効な入力です。'y'または'n'を入力してください。")
-            if answer == 'y':
-                for employee in new_employees:
-                    create_new_employee(cur, *employee)
-                return True
-            else:
-                return False
+# 登録済みの社員番号をまとめて取得する（1行ずつSELECTしない）
+def fetch_registered_employee_ids(cur, employee_ids):
+    registered_ids = set()
+    for chunk in batched(employee_ids, max_batch_rows(1)):  # SQLiteのパラメータ数上限ごとに分割する
+        placeholders = ",".join("?" * len(chunk))
+        cur.execute(f"SELECT employee_id FROM employees WHERE employee_id IN ({placeholders})", chunk)
+        registered_ids.update(employee_id for (employee_id,) in cur.fetchall())
+    return registered_ids
+
+# 未登録社員の登録をユーザーに確認する（データベースへの書き込みは行わない）
+# 登録する未登録社員のリスト（未登録社員がいなければ空のリスト）を返し、登録が拒否された場合は None を返す
+def confirm_new_employees(cur, rows):
+    employees = {row.employee_id: row.employee_name for row in rows}  # 社員番号の重複を除く
+    registered_ids = fetch_registered_employee_ids(cur, list(employees))
+    new_employees = [employee for employee in employees.items() if employee[0] not in registered_ids]
+    if new_employees:
+        print(f"未登録社員が {len(new_employees)} 件見つかりました")
+        for employee in new_employees:
+            print(f"社員番号 {employee[0]}, 社員名 {employee[1]}")
+        while True:  # ユーザーからの入力をバリデーションする
+            answer = input("これらの未登録社員を登録しますか？ (y/n): ").lower()
+            if answer in ['y', 'n']:
+                break
+            print("無効な入力です。'y'または'n'を入力してください。")
+        if answer == 'y':
+            return new_employees
         else:
-            return True
+            return None
+    else:
+        return new_employees
 
 # 社員番号をキーにしてデータを更新する
-def update_data_from_csv(cur, filename, table, column, column_name):
-    with open(filename, 'r', newline='') as file:
-        reader = csv.DictReader(file)
-        data = []
-        for row in reader:
-            employee_id = row.get('社員番号')
-            value = row.get(column_name)
-            if employee_id and value:
-                try:
-                    data.append((value, employee_id))
-                except ValueError:
-                    print(f"無効な{column}があります: {value}")
-        cur.executemany(f"UPDATE {table} SET {column}=? WHERE employee_id=?", data)
-        print(f"🎉 合計 {len(data)} 件の{column_name}が更新されました")
+def update_data_from_csv(cur, rows, column_name):
+    get_pair = operator.attrgetter('employee_id', EMPLOYEE_ROW_FIELD_BY_COLUMN[column_name])
+    # 社員番号が重複する場合は後の行を優先する（バッチの区切りに関係なく同じ結果になるよう、全体で重複を除く）
+    # attrgetter・filterでループをC側に任せ、空の値は更新しない
+    data = dict(filter(operator.itemgetter(1), map(get_pair, rows)))
+    count = 0
+    for batch in batched(data.items(), max_batch_rows(2)):  # 1行あたり2つのパラメータを使う
+        if SUPPORTS_UPDATE_FROM:
+            values = ",".join(["(?,?)"] * len(batch))
+            cur.execute(BATCH_UPDATE_SQL_BY_COLUMN[column_name].format(values=values),
+                        list(itertools.chain.from_iterable(batch)))
+        else:
+            cur.executemany(UPDATE_SQL_BY_COLUMN[column_name],
+                            ((value, employee_id) for employee_id, value in batch))
+        count += cur.rowcount  # 実際に更新された行数を数える
+    print(f"🎉 合計 {count} 件の{column_name}が更新されました")
+    return count
 
 # メイン処理
 def main():
@@ -172,12 +279,17 @@ def main():
         return
 
     filename = sys.argv[1]
-    if validate_file_and_data(filename):
+    rows = validate_file_and_data(filename)  # CSVの読み込みはここで1回だけ行う
+    if rows is not None:
         with DatabaseConnection() as (conn, cur):
             create_tables(cur)
-            if create_new_employees_from_csv(cur, filename):
-                update_data_from_csv(cur, filename, 'employees', 'employee_name', '社員名')
-                update_data_from_csv(cur, filename, 'salaries', 'basic_salary', '基本給')
+            new_employees = confirm_new_employees(cur, rows)  # 入力待ちの間はトランザクションを保持しない
+            if new_employees is not None:
+                begin_transaction(conn)
+                if new_employees:
+                    create_new_employees(cur, new_employees)
+                update_data_from_csv(cur, rows, '社員名')
+                update_data_from_csv(cur, rows, '基本給')
             else:
                 print("⚡️ 未登録社員が含まれたため、データの更新を中止しました")
     else:
@@ -1,37 +1,213 @@
+import os
 import sqlite3
+import tempfile
 import unittest
 from unittest.mock import patch, mock_open
 import main  # テスト対象のモジュール
 
+# テストクラス全体で共有するメモリ上のデータベース
+TEST_DB_URI = "file:testdb?mode=memory&cache=shared"
+
 class TestMain(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # 共有データベースを保持する接続を開き、スキーマは1回だけ作成する
+        # （テスト対象のコードが各テストの接続を閉じても、この接続が残る限りデータベースは破棄されない）
+        cls.shared_conn = sqlite3.connect(TEST_DB_URI, uri=True)
+        main.create_tables(cls.shared_conn.cursor())
+        cls.shared_conn.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        # テストクラス終了後のクリーンアップ
+        cls.shared_conn.close()
+
     def setUp(self):
-        # テスト前のセットアップ
-        self.conn = sqlite3.connect(':memory:')  # メモリ上の一時データベースを作成
+        # テスト前のセットアップ（テーブルは作り直さずデータだけを削除する）
+        self.conn = sqlite3.connect(TEST_DB_URI, uri=True)
         self.cur = self.conn.cursor()
-        self.cur.execute('''CREATE TABLE employees (
-                            employee_id INTEGER PRIMARY KEY,
-                            employee_name TEXT NOT NULL)''')
-        self.cur.execute('''CREATE TABLE salaries (
-                            employee_id INTEGER PRIMARY KEY,
-                            basic_salary INTEGER NOT NULL)''')
+        self.cur.executescript("DELETE FROM salaries; DELETE FROM employees;")
 
     def tearDown(self):
         # テスト後のクリーンアップ
         self.conn.close()
 
-    @patch('sqlite3.connect')
-    def test_update_salary(self, mock_connect):
-        # テスト前のセットアップ
-        mock_connect.return_value = self.conn
+    def write_csv(self, content):
+        # 一時CSVファイルを作成し、テスト終了時に削除する
+        file = tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', newline='', delete=False)
+        with file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        return file.name
+
+    def test_update_salary(self):
         # 社員マスタと給与マスタにテストデータを挿入
         self.cur.execute("INSERT INTO employees (employee_id, employee_name) VALUES (1, 'Test Employee')")
         self.cur.execute("INSERT INTO salaries (employee_id, basic_salary) VALUES (1, 1000)")
 
         # 給与の更新をテスト
-        updated = main.update_salary(1, 2000)
+        updated = main.update_data_from_csv(self.cur, (main.EmployeeRow(1, 'Test Employee', 2000),), '基本給')
         self.assertEqual(updated, 1)
         self.cur.execute("SELECT basic_salary FROM salaries WHERE employee_id=1")
         self.assertEqual(self.cur.fetchone()[0], 2000)
 
+    @patch('builtins.input')
+    @patch('sqlite3.connect')
+    def test_main_imports_csv(self, mock_connect, mock_input):
+        # DatabaseConnection がテスト用の接続を閉じても共有データベースは残る
+        mock_connect.return_value = self.conn
+
+        def answer(prompt):
+            # 入力待ちの間はトランザクションを開始していないこと
+            self.assertFalse(self.conn.in_transaction)
+            return 'y'
+        mock_input.side_effect = answer
+        filename = self.write_csv("社員番号,社員名,基本給\n1,Alice,100\n2,Bob,200\n")
+        with patch('sys.argv', ['main.py', filename]):
+            main.main()
+
+        cur = self.shared_conn.cursor()
+        cur.execute("SELECT employee_id, employee_name, basic_salary FROM employees JOIN salaries USING (employee_id) "
+                    "ORDER BY employee_id")
+        self.assertEqual(cur.fetchall(), [(1, 'Alice', 100), (2, 'Bob', 200)])
+        mock_input.assert_called_once()
+
+    def test_create_new_employees_with_null_salary_row(self):
+        # 給与マスタに社員番号が NULL の行があっても、新規社員の給与行が登録されること
+        self.cur.execute("INSERT INTO salaries (employee_id, basic_salary) VALUES (NULL, 5)")
+        main.create_new_employees(self.cur, [(1, 'A'), (2, 'B')])
+        self.cur.execute("SELECT employee_id, basic_salary FROM salaries WHERE employee_id IS NOT NULL ORDER BY employee_id")
+        self.assertEqual(self.cur.fetchall(), [(1, 0), (2, 0)])
+
+    def test_create_new_employees_ignores_unrelated_employees(self):
+        # 今回登録しない既存社員には給与行を作らないこと
+        self.cur.execute("INSERT INTO employees (employee_id, employee_name) VALUES (9, 'Existing')")
+        main.create_new_employees(self.cur, [(1, 'A')])
+        self.cur.execute("SELECT employee_id FROM salaries ORDER BY employee_id")
+        self.assertEqual(self.cur.fetchall(), [(1,)])
+
+    def test_create_tables_with_duplicate_salaries(self):
+        # 給与マスタに同じ社員の行が重複している既存のデータベースでもインデックスを作成できること
+        conn = sqlite3.connect(':memory:')
+        self.addCleanup(conn.close)
+        cur = conn.cursor()
+        cur.execute("CREATE TABLE salaries (employee_id INTEGER, basic_salary INTEGER NOT NULL)")
+        cur.executemany("INSERT INTO salaries (employee_id, basic_salary) VALUES (?, ?)", [(1001, 100), (1001, 200)])
+        main.create_tables(cur)
+        cur.execute("SELECT name FROM sqlite_master WHERE type='index' AND name='idx_salaries_emp'")
+        self.assertEqual(cur.fetchall(), [('idx_salaries_emp',)])
+        cur.execute("SELECT COUNT(*) FROM salaries WHERE employee_id=1001")
+        self.assertEqual(cur.fetchone()[0], 2)
+
+    def test_validate_file_and_data(self):
+        # 検証済みの行が EmployeeRow のタプルとして返り、空行は読み飛ばされること
+        filename = self.write_csv("社員番号,社員名,基本給\n1,A,100\n\n2,B,200\n")
+        self.assertEqual(main.validate_file_and_data(filename),
+                         (main.EmployeeRow(1, 'A', 100), main.EmployeeRow(2, 'B', 200)))
+
+    def test_validate_file_and_data_reordered_columns(self):
+        # 列の順序が異なっていても列名で値を取り出すこと
+        filename = self.write_csv("基本給,社員番号,社員名\n100,1,A\n200,2\n")
+        self.assertEqual(main.validate_file_and_data(filename),
+                         (main.EmployeeRow(1, 'A', 100), main.EmployeeRow(2, '', 200)))
+
+    def test_validate_file_and_data_invalid_header(self):
+        # 列の不足・不正な列・重複した列を拒否すること
+        for header, message in [("社員番号,基本給", "列名が不正です"),
+                                ("社員番号,社員名,基本給,備考", "列名が不正です"),
+                                ("社員番号,社員名,基本給,社員名", "列名が重複しています")]:
+            with self.subTest(header=header):
+                filename = self.write_csv(f"{header}\n1,A,100\n")
+                with self.assertLogs(level='ERROR') as logs:
+                    self.assertIsNone(main.validate_file_and_data(filename))
+                self.assertIn(message, logs.output[0])
+
+    def test_validate_file_and_data_invalid_file(self):
+        # 存在しないファイルやCSV以外のファイルを拒否すること
+        with self.assertLogs(level='ERROR') as logs:
+            self.assertIsNone(main.validate_file_and_data('not_found.csv'))
+            self.assertIsNone(main.validate_file_and_data('data.txt'))
+        self.assertIn("ファイルが見つかりません", logs.output[0])
+        self.assertIn("CSVファイルを指定してください", logs.output[1])
+
+    def test_validate_rows(self):
+        # 全行が正常な場合（一括変換の経路）
+        self.assertEqual(main.validate_rows([('1', 'A', '100'), ('2', '', '200')]),
+                         (main.EmployeeRow(1, 'A', 100), main.EmployeeRow(2, '', 200)))
+        self.assertEqual(main.validate_rows([]), ())
+
+    def test_validate_rows_invalid(self):
+        # 不正な行がある場合（1行ずつ確認する経路）は最初の不正な行を報告すること
+        for fields, message in [([('1', 'A', '100'), ('2', 'B', '')], "欠損値があります: 社員番号 2"),
+                                ([('1', 'A', 'abc')], "数値に変換できません: 社員番号 1"),
+                                ([('1', 'A', '100'), ('0', 'B', '200')], "正の整数を指定してください: 社員番号 0"),
+                                ([('3', 'C', '-1'), ('x', 'D', '1')], "正の整数を指定してください: 社員番号 3")]:
+            with self.subTest(fields=fields):
+                with self.assertLogs(level='ERROR') as logs:
+                    self.assertIsNone(main.validate_rows(fields))
+                self.assertEqual(len(logs.output), 1)
+                self.assertIn(message, logs.output[0])
+
+    def test_batched(self):
+        self.assertEqual(list(main.batched(range(5), 2)), [(0, 1), (2, 3), (4,)])
+        self.assertEqual(list(main.batched([], 2)), [])
+
+    def test_fetch_registered_employee_ids(self):
+        # パラメータ数の上限を超える件数でも分割して全件を確認すること
+        self.cur.executemany("INSERT INTO employees (employee_id, employee_name) VALUES (?, 'x')",
+                             [(employee_id,) for employee_id in range(1, 2001, 2)])
+        registered_ids = main.fetch_registered_employee_ids(self.cur, list(range(1, 2001)))
+        self.assertEqual(registered_ids, set(range(1, 2001, 2)))
+        with patch('main.MAX_SQL_PARAMS', 3):
+            self.assertEqual(main.fetch_registered_employee_ids(self.cur, [1, 2, 3, 5, 1999]), {1, 3, 5, 1999})
+
+    @patch('builtins.input', return_value='y')
+    def test_confirm_new_employees(self, mock_input):
+        # 未登録社員だけを（社員番号の重複を除いて）返し、データベースには書き込まないこと
+        self.cur.execute("INSERT INTO employees (employee_id, employee_name) VALUES (1, 'A')")
+        rows = (main.EmployeeRow(1, 'A', 100), main.EmployeeRow(2, 'B', 200), main.EmployeeRow(2, 'B2', 300))
+        self.assertEqual(main.confirm_new_employees(self.cur, rows), [(2, 'B2')])
+        self.cur.execute("SELECT employee_id FROM employees ORDER BY employee_id")
+        self.assertEqual(self.cur.fetchall(), [(1,)])
+
+    @patch('builtins.input', return_value='n')
+    def test_confirm_new_employees_declined(self, mock_input):
+        # 登録を拒否した場合は None を返すこと
+        self.assertIsNone(main.confirm_new_employees(self.cur, (main.EmployeeRow(1, 'A', 100),)))
+
+    @patch('builtins.input')
+    def test_confirm_new_employees_without_new_employees(self, mock_input):
+        # 未登録社員がいなければ確認せずに空のリストを返すこと
+        self.cur.execute("INSERT INTO employees (employee_id, employee_name) VALUES (1, 'A')")
+        self.assertEqual(main.confirm_new_employees(self.cur, (main.EmployeeRow(1, 'A', 100),)), [])
+        mock_input.assert_not_called()
+
+    def test_update_data_from_csv(self):
+        # 社員番号が重複する場合は後の行を優先し、空の社員名では更新しないこと
+        self.cur.executemany("INSERT INTO employees (employee_id, employee_name) VALUES (?, ?)", [(1, 'A'), (2, 'B')])
+        self.cur.executemany("INSERT INTO salaries (employee_id, basic_salary) VALUES (?, 0)", [(1,), (2,)])
+        rows = (main.EmployeeRow(1, 'A1', 100), main.EmployeeRow(2, '', 200), main.EmployeeRow(1, 'A2', 300))
+        for supports_update_from in (True, False):  # UPDATE ... FROM と1行ずつの更新の両方
+            with self.subTest(supports_update_from=supports_update_from), \
+                    patch('main.SUPPORTS_UPDATE_FROM', supports_update_from):
+                self.assertEqual(main.update_data_from_csv(self.cur, rows, '社員名'), 1)
+                self.assertEqual(main.update_data_from_csv(self.cur, rows, '基本給'), 2)
+                self.cur.execute("SELECT employee_id, employee_name, basic_salary FROM employees "
+                                 "JOIN salaries USING (employee_id) ORDER BY employee_id")
+                self.assertEqual(self.cur.fetchall(), [(1, 'A2', 300), (2, 'B', 200)])
+
+    def test_update_data_from_csv_across_batches(self):
+        # バッチをまたいで社員番号が重複する場合も後の行を優先すること
+        self.cur.executemany("INSERT INTO employees (employee_id, employee_name) VALUES (?, 'x')", [(1,), (2,)])
+        self.cur.executemany("INSERT INTO salaries (employee_id, basic_salary) VALUES (?, 0)", [(1,), (2,)])
+        # 社員番号 3 は給与マスタに存在しないため件数に含めない
+        rows = (main.EmployeeRow(1, 'x', 100), main.EmployeeRow(2, 'x', 200), main.EmployeeRow(3, 'x', 400),
+                main.EmployeeRow(1, 'x', 300))
+        for max_sql_params in (4, 999):  # 1バッチ2行・全行で1バッチのどちらでも同じ件数になること
+            with self.subTest(max_sql_params=max_sql_params), patch('main.MAX_SQL_PARAMS', max_sql_params):
+                self.assertEqual(main.update_data_from_csv(self.cur, rows, '基本給'), 2)
+        self.cur.execute("SELECT employee_id, basic_salary FROM salaries ORDER BY employee_id")
+        self.assertEqual(self.cur.fetchall(), [(1, 300), (2, 200)])
+
 if __name__ == '__main__':
     unittest.main()